@@ -1,12 +1,19 @@
 import logging
 
-logging.basicConfig(
-    filename='anon_excel.log',
-    filemode='w',
-    format='%(asctime)s %(levelname)-8s %(message)s',
-    level=logging.INFO,
-    datefmt='%Y-%m-%d %H:%M:%S')
 log = logging.getLogger(__name__)
-ch = logging.StreamHandler()
-ch.setLevel(logging.INFO)
-log.addHandler(ch)
+
+
+def setup_logging() -> None:
+    '''Log to the file anon_excel.log and to the console. Only called
+       by the main process (see anon.main); worker processes forward
+       their records to it (see anon.process_surveys)
+    '''
+    logging.basicConfig(
+        filename='anon_excel.log',
+        filemode='w',
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S')
+    ch = logging.StreamHandler()
+    ch.setLevel(logging.INFO)
+    log.addHandler(ch)
@@ -1,20 +1,38 @@
 import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import functools
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import multiprocessing
+from multiprocessing.queues import Queue
 import os
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import re
 import sys
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
+import xlsxwriter
+from xlsxwriter.format import Format
+from anon_excel import setup_logging
 from anon_excel.calc_stats import (
     determine_distinct_students, paired_ttest)
 import anon_excel.constants as const
-from anon_excel.survey_files import find_survey_files, load_and_prepare_survey_data
-from anon_excel.ranking_data import load_ranking_from_folder
+from anon_excel.survey_files import (
+    analysis_columns, cleaned_columns, find_survey_files,
+    load_and_prepare_survey_data)
+from anon_excel.ranking_data import (
+    get_rank_lookup, load_ranking_from_folder, set_rank_lookup)
 
 log = logging.getLogger(__name__)
 
+DATE_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+# last `(n-m)` in a survey filename
+SEQUENCE_PATTERN = re.compile(r'.*(\(\d+-\d+\))')
+# record colors in the cleaned data
+COLOR_COMMON = '#CCFFCC'  # green: student in both surveys
+COLOR_PRE_ONLY = '#CCCCFF'  # purple/blue: student only in pre-survey
+COLOR_POST_ONLY = '#FFCCCC'  # red: student only in post-survey
+
 
 def get_parser() -> argparse.ArgumentParser:
     '''Setup a command line parser'''
@@ -73,11 +91,12 @@ def remove_previous_results(files: list[Path], do_overwrite: bool, which_output:
     if not files:
         return True
 
-    prev = [Path(p).name for p in files]
     if do_overwrite:
-        log.info(f'Trying to remove previous {which_output} results: \n{prev}')
+        if log.isEnabledFor(logging.INFO):
+            prev = ', '.join(f.name for f in files)
+            log.info(f'Trying to remove previous {which_output} results: \n{prev}')
         for f in files:
-            os.remove(f)
+            os.unlink(f)
         return True
 
     log.error(f'Output {which_output} data already exists.\n'
@@ -86,30 +105,91 @@ def remove_previous_results(files: list[Path], do_overwrite: bool, which_output:
     return False
 
 
+def find_previous_results(out_folder: Path, which_output: str) -> list[Path]:
+    '''Find the excel outputs `<which_output>*.xlsx` in `out_folder` with a
+       single read of the folder; a missing folder has no outputs.
+       Names are matched as in find_survey_files: case-insensitive where the
+       file system is (Windows)
+    '''
+    prefix = os.path.normcase(which_output)
+    suffix = os.path.normcase('.xlsx')
+    try:
+        with os.scandir(out_folder) as entries:
+            return sorted(out_folder / e.name for e in entries
+                          if os.path.normcase(e.name).startswith(prefix)
+                          and os.path.normcase(e.name).endswith(suffix)
+                          and e.is_file())
+    except FileNotFoundError:
+        return []
+
+
 def check_remove_all_outputs(folder: Path, clean: bool, ttest: bool, overwrite: bool) -> bool:
     for check, rem in zip([const.ANALYSIS_OUTPUT_BASE, const.CLEANED_OUTPUT_BASE], [ttest, clean or ttest]):
         if not rem:
             continue
-        cur_fol = folder / check
-        prev = list(cur_fol.glob(f'{check}*.xlsx'))
+        prev = find_previous_results(folder / check, check)
         if not remove_previous_results(prev, which_output=check, do_overwrite=overwrite):
             return False
 
     return True
 
 
+@functools.cache
 def check_create_out_folder(folder: Path):
-    '''Make sure folder exists'''
-    if folder.exists() and folder.is_dir():
-        return True
-
-    folder.mkdir()
-
-
-def write_to_excel(filename: Path, sheets: tuple[list[pd.DataFrame], str]) -> None:
-    with pd.ExcelWriter(filename, engine='xlsxwriter') as writer:
+    '''Make sure folder exists; this is only checked once per folder'''
+    # exist_ok: parallel survey workers can race to create the folder
+    folder.mkdir(exist_ok=True)
+
+
+def fill_formats(book: xlsxwriter.Workbook,
+                 colors: set[str]) -> dict[str, tuple[Format, Format]]:
+    '''Create a background fill format for each color: one for regular
+       cells, and one that also keeps the date display for date cells'''
+    return {color: (book.add_format({'bg_color': color, 'pattern': 1}),
+                    book.add_format({'bg_color': color, 'pattern': 1,
+                                     'num_format': DATE_FORMAT}))
+            for color in colors}
+
+
+def write_to_excel(filename: Path, sheets: list[tuple[pd.DataFrame, str]],
+                   row_colors: dict[str, list[str | None]] | None = None) -> None:
+    '''Write each dataframe to its own sheet. The rows are streamed to the file
+       with xlsxwriter in constant_memory mode, so only a single row is kept in
+       memory. Note that pandas' `to_excel` writes column by column, which is
+       not possible in this mode.
+       Optionally `row_colors` contains for a sheet the background color
+       of each record (None for no color).
+    '''
+    row_colors = row_colors or {}
+    # write strings as is: skip the url and number detection for each cell
+    options = {'constant_memory': True,
+               'default_date_format': DATE_FORMAT,
+               'strings_to_urls': False,
+               'strings_to_numbers': False}
+    with xlsxwriter.Workbook(filename, options) as book:
+        # a single format shared by the headers of all sheets
+        header_format = book.add_format({'bold': True})
+        fills = fill_formats(book, {color for colors in row_colors.values()
+                                    for color in colors if color})
         for df, sheetname in sheets:
-            df.to_excel(writer, sheet_name=sheetname, index=False)
+            sheet = book.add_worksheet(sheetname)
+            sheet.write_row(0, 0, df.columns, header_format)
+            colors = row_colors.get(sheetname)
+            is_date = [pd.api.types.is_datetime64_any_dtype(dtype)
+                       for dtype in df.dtypes]
+            # same representation as pandas: empty cells for missing values
+            values = df.replace([np.inf, -np.inf], ['inf', '-inf']).astype(object)
+            values = values.where(df.notna(), None)
+            for row_nr, row in enumerate(values.itertuples(index=False, name=None),
+                                         start=1):
+                color = colors[row_nr - 1] if colors else None
+                if color is None:
+                    sheet.write_row(row_nr, 0, row)
+                    continue
+                cell_format, date_format = fills[color]
+                for col_nr, value in enumerate(row):
+                    sheet.write(row_nr, col_nr, value,
+                                date_format if is_date[col_nr] else cell_format)
 
 
 def validate_input(args) -> tuple[Path, str]:
@@ -139,24 +219,36 @@ def determine_survey_data_name(survey_file: Path, sequence_nr: int) -> str:
     '''
     patt = f'{sequence_nr:02}'
 
-    regex = r'.*(\(\d+-\d+\))'
-    m = re.match(regex, survey_file.name)
-    if m and (len(m.groups()) == 1):
+    m = SEQUENCE_PATTERN.match(survey_file.name)
+    if m:
         patt = m.group(1)
 
     return f'{const.DATA_OUTPUT_BASENAME}_{patt}'
 
 
+def student_colors(students: pd.Series, stud_common: set[str],
+                   studs_only: set[str], only_color: str) -> list[str | None]:
+    '''Determine the color of each student record: green for students in
+       both surveys, `only_color` for students only in this survey'''
+    return [COLOR_COMMON if stud in stud_common
+            else only_color if stud in studs_only
+            else None
+            for stud in students]
+
+
 def clean_and_save_survey_data(folder: Path,
                                pre_file: Path, post_file: Path,
                                df_pre: pd.DataFrame, df_post: pd.DataFrame | None,
                                seq_nr: int,
-                               anonymize: int) -> Path:
+                               anonymize: int,
+                               color_column: str | None = None) -> Path:
     ''' Save survey data to excel. Only keep relevant columns.
         Depending on the command line parameter `anonymize` the following happens:
         `anonymize=0` : student ID column is retained, no anonymized data in output
         `anonymize=1` : student ID column is retained, also anonymized data in output
         `anonymize=2` : student ID column is removed, only anonymized data in output
+        When `color_column` is set and both surveys are available, the records
+        are colored depending on the students (in `color_column`) in both surveys.
     '''
     out_folder = folder / const.CLEANED_OUTPUT_BASE
     check_create_out_folder(out_folder)
@@ -168,19 +260,31 @@ def clean_and_save_survey_data(folder: Path,
     cols_to_drop = const.DROP_COLUMNS
     if anonymize == 0:  # 0 == drop anonymized data
         log.info(f'Do not save anonymized data, {anonymize=}')
-        cols_to_drop = [*const.DROP_COLUMNS, const.ANONYMOUS_ID]
+        cols_to_drop = const.DROP_COLUMNS | {const.ANONYMOUS_ID}
     if anonymize == 2:  # 2 == drop sensitive data
         log.info(f'Removing sensitive data, {anonymize=}')
-        cols_to_drop = [*const.DROP_COLUMNS, const.DEFAULT_STUDENT_COLUMN]
+        cols_to_drop = const.DROP_COLUMNS | {const.DEFAULT_STUDENT_COLUMN}
     remain_columns = [col for col in df_pre.columns if col not in cols_to_drop]
     clean_data = [(df_pre[remain_columns], const.CLEAN_SHEET_PRE_SURVEY)]
     if post_file.name:
-        remain_columns = [
-            col for col in df_post.columns if col not in cols_to_drop]
+        # mostly the post-survey has the same columns as the pre-survey
+        if not df_post.columns.equals(df_pre.columns):
+            remain_columns = [
+                col for col in df_post.columns if col not in cols_to_drop]
         clean_data.append((df_post[remain_columns], const.CLEAN_SHEET_POST_SURVEY))
 
+    row_colors = None
+    if color_column and post_file.name:
+        stud_common, studs_before_only, stud_after_only = determine_distinct_students(
+            df_pre, df_post, color_column)
+        row_colors = {
+            const.CLEAN_SHEET_PRE_SURVEY: student_colors(
+                df_pre[color_column], stud_common, studs_before_only, COLOR_PRE_ONLY),
+            const.CLEAN_SHEET_POST_SURVEY: student_colors(
+                df_post[color_column], stud_common, stud_after_only, COLOR_POST_ONLY)}
+
     log.info(f'Writing cleaned data to "{clean_output}"')
-    write_to_excel(clean_output, sheets=clean_data)
+    write_to_excel(clean_output, sheets=clean_data, row_colors=row_colors)
 
     return clean_output
 
@@ -207,60 +311,114 @@ def ttest_and_save(folder: Path, pre_file: Path,
     write_to_excel(excel_output, sheets=ttest_output)
 
 
-def find_id_column_index(worksheet, column_name: str):
-    ''' Function to find the column index of 'id_column' '''
-    for cell in worksheet[1]:  # Iterate over the first row (header)
-        if cell.value == column_name:
-            return cell.col_idx - 1  # Return zero-based index
+def process_survey(folder: Path, pre_file: Path, post_file: Path, seq_nr: int,
+                   id_column: str, args: argparse.Namespace) -> None:
+    '''Clean, save and analyse a single set of pre- and post-survey files'''
+    log.info('Initiating analysis')
+    # do not read the columns that never end up in the output; and without
+    # cleaned output only the columns for the T-test are needed
+    usecols = cleaned_columns() if args.clean else analysis_columns(id_column)
+    # the anonymized ID's are only needed when saved or for the T-test
+    anonymize = args.anonymize > 0 or args.ttest
+    # read the pre- and post-survey files concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        log.info(f'Pre-survey file: "{pre_file}"')
+        pre_future = executor.submit(
+            load_and_prepare_survey_data, pre_file, id_column, args.strip,
+            usecols=usecols, anonymize=anonymize)
+        if post_file.name:
+            log.info(f'Post-survey file: "{post_file}"')
+            df_post = executor.submit(
+                load_and_prepare_survey_data, post_file, id_column, args.strip,
+                usecols=usecols, anonymize=anonymize).result()
+        else:
+            df_post = None
+            log.info('No accompanying post file')
+            if args.ttest:
+                log.info('Skipping T-test')
+        df_pre = pre_future.result()
 
+    if args.clean:
+        # optionally apply colors; only when both pre- and post_survey are available
+        sel_col = None
+        if args.color:
+            sel_col = const.ANONYMOUS_ID
+            if args.anonymize == 0:
+                sel_col = id_column
+        clean_and_save_survey_data(
+            folder, pre_file, post_file, df_pre, df_post,
+            seq_nr,
+            args.anonymize,
+            color_column=sel_col)
 
-def colorize_excel(excel_file: Path,
-                   df_pre: pd.DataFrame, df_post: pd.DataFrame,
-                   id_column: str):
-    book = load_workbook(excel_file)
-
-    stud_common, studs_before_only, stud_after_only = determine_distinct_students(
-        df_pre, df_post, id_column)
-
-    # Define fills
-    fill_green = PatternFill(start_color="CCFFCC",
-                             end_color="CCFFCC", fill_type="solid")
-    fill_blue = PatternFill(start_color="CCCCFF", end_color="CCCCFF", fill_type="solid")
-    fill_red = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
-
-    # Get the worksheets
-    ws_pre = book[const.CLEAN_SHEET_PRE_SURVEY]
-    ws_post = book[const.CLEAN_SHEET_POST_SURVEY]
-
-    # get index of the id_column
-    id_col_idx_pre = find_id_column_index(ws_pre, id_column)
-    id_col_idx_post = find_id_column_index(ws_post, id_column)
-
-    # Apply conditional formatting for survey_pre
-    for row in ws_pre.iter_rows(min_row=2, max_row=ws_pre.max_row, min_col=1, max_col=ws_pre.max_column):
-        cell_value = row[id_col_idx_pre].value
-        if cell_value in stud_common:
-            for cell in row:
-                cell.fill = fill_green
-        elif cell_value in studs_before_only:
-            for cell in row:
-                cell.fill = fill_blue
-
-    # Apply conditional formatting for survey_post
-    for row in ws_post.iter_rows(min_row=2, max_row=ws_post.max_row, min_col=1, max_col=ws_post.max_column):
-        cell_value = row[id_col_idx_post].value
-        if cell_value in stud_common:
-            for cell in row:
-                cell.fill = fill_green
-        elif cell_value in stud_after_only:
-            for cell in row:
-                cell.fill = fill_red
-
-    # Save the updated Excel file
-    book.save(excel_file)
+    # T-test is only possible with both pre- and post_survey files
+    if args.ttest and post_file.name:
+        ttest_and_save(folder, pre_file, df_pre, df_post, seq_nr)
+
+
+class _ForwardHandler(logging.Handler):
+    '''Hand log records received from worker processes to the local logger'''
+
+    def emit(self, record: logging.LogRecord) -> None:
+        logging.getLogger(record.name).handle(record)
+
+
+def init_worker(rank_lookup: dict, log_queue: Queue) -> None:
+    '''Setup a worker process: send all logging to the main process
+       and use the ranking lookup already loaded by the main process
+    '''
+    root = logging.getLogger()
+    # a forked worker inherits the handlers of the main process
+    for logger in (root, logging.getLogger('anon_excel')):
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+            handler.close()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+
+    set_rank_lookup(rank_lookup)
+
+
+def process_surveys(folder: Path, surveys: list[tuple[Path, Path]],
+                    id_column: str, args: argparse.Namespace) -> None:
+    '''Process all survey sets. The sets are independent, so with more than one
+       set they are distributed over multiple processes.
+       With multiple processes a failing set does not stop the other sets:
+       these still run to completion, after which the first error is raised
+    '''
+    workers = min(len(surveys), os.cpu_count() or 1)
+    if workers < 2:
+        for seq_nr, (pre_file, post_file) in enumerate(surveys, start=1):
+            process_survey(folder, pre_file, post_file, seq_nr, id_column, args)
+        return
+
+    log_queue = multiprocessing.Queue()
+    listener = QueueListener(log_queue, _ForwardHandler())
+    executor = ProcessPoolExecutor(max_workers=workers,
+                                   initializer=init_worker,
+                                   initargs=(get_rank_lookup(), log_queue))
+    futures = [executor.submit(process_survey, folder, pre_file, post_file,
+                               seq_nr, id_column, args)
+               for seq_nr, (pre_file, post_file) in enumerate(surveys, start=1)]
+    # submitting has started the worker processes; only now start the listener
+    # thread, forking a process with multiple threads may deadlock. Until then
+    # the records of the workers wait in the queue
+    listener.start()
+    try:
+        with executor:
+            try:
+                # re-raise any exception from the workers, in survey order
+                for future in futures:
+                    future.result()
+            except KeyboardInterrupt:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        listener.stop()
 
 
 def main():
+    setup_logging()
     args = get_parser().parse_args()
 
     folder, id_column = validate_input(args)
@@ -280,35 +438,7 @@ def main():
         sys.exit()
 
     # start processing
-    for seq_nr, (pre_file, post_file) in enumerate(surveys, start=1):
-        log.info('Initiating analysis')
-        log.info(f'Pre-survey file: "{pre_file}"')
-        df_pre = load_and_prepare_survey_data(pre_file, id_column, args.strip)
-        if post_file.name:
-            log.info(f'Post-survey file: "{post_file}"')
-            df_post = load_and_prepare_survey_data(post_file, id_column, args.strip)
-        else:
-            df_post = None
-            log.info('No accompanying post file')
-            if args.ttest:
-                log.info('Skipping T-test')
-
-        if args.clean:
-            clean_output = clean_and_save_survey_data(
-                folder, pre_file, post_file, df_pre, df_post,
-                seq_nr,
-                args.anonymize)
-
-            # optionally apply styles/colors; only when both pre- and post_survey are available
-            if args.color and post_file.name:
-                sel_col = const.ANONYMOUS_ID
-                if args.anonymize == 0:
-                    sel_col = id_column
-                colorize_excel(clean_output, df_pre, df_post, sel_col)
-
-        # T-test is only possible with both pre- and post_survey files
-        if args.ttest and post_file.name:
-            ttest_and_save(folder, pre_file, df_pre, df_post, seq_nr)
+    process_surveys(folder, surveys, id_column, args)
 
 
 if __name__ == '__main__':
@@ -1,58 +1,54 @@
 import logging
+import re
+import numpy as np
 import pandas as pd
-from scipy import stats
 from anon_excel.ranking_data import get_rank_lookup
 
 
 log = logging.getLogger(__name__)
 
+WHITESPACE = re.compile(r'\s+')
+
 
 def category_to_rank(df: pd.DataFrame) -> pd.DataFrame:
     ''' Transform answer categories to numerical rankings
     '''
     log.info('Transform categories to numerical values')
-    df_rank = df.copy()
-    for question, ranks in get_rank_lookup().items():
-        if question in list(df_rank.columns):
-            # strip whitespace
-            df_rank[question] = df_rank[question].replace(r'\s+', ' ', regex=True)
-            df_rank[question] = df_rank[question].map(ranks)
-
-    return df_rank
+    rank_lookup = get_rank_lookup()
+    # determine the survey questions in a single pass over the columns
+    questions = [col for col in df.columns if col in rank_lookup]
+    ranked = {}
+    for question in questions:
+        ranks = rank_lookup[question]
+        answers = df[question]
+        # there are only a few distinct answers: normalize the whitespace
+        # of those only, and map all answers with a single lookup
+        to_rank = {answer: ranks.get(WHITESPACE.sub(' ', answer)
+                                     if isinstance(answer, str) else answer, np.nan)
+                   for answer in answers.dropna().unique()}
+        ranked[question] = answers.map(to_rank)
+
+    # a new dataframe with only the ranked columns replaced, the input is unchanged
+    return df.assign(**ranked)
 
 
 def determine_common_questions(bf_quest: list, af_quest: list) -> list:
     '''
         Find questions available in both surveys
     '''
-    qset = set(get_rank_lookup().keys())
     col_set_before = set(bf_quest)
     col_set_after = set(af_quest)
     # find common columns in pre and post surveys
     # and find columns only available in post survey
     common_cols = col_set_before.intersection(col_set_after)
     post_cols = col_set_after.difference(col_set_before)
-    # only keep the survey questions
-    questions_unordered = list(qset.intersection(common_cols))
-    questions_post_unordered = list(qset.intersection(post_cols))
-    # keep the questions in the original order
-    questions = [q for q in get_rank_lookup().keys() if q in questions_unordered]
-    questions_post = [q for q in get_rank_lookup().keys()
-                      if q in questions_post_unordered]
+    # only keep the survey questions, in the original order
+    rank_lookup = get_rank_lookup()
+    questions = [q for q in rank_lookup if q in common_cols]
+    questions_post = [q for q in rank_lookup if q in post_cols]
     return questions, questions_post
 
 
-def determine_common_students(bf_studs: list, af_studs: list) -> list:
-    '''
-        Find students common to both surveys
-    '''
-    stud_before = set(bf_studs)
-    stud_after = set(af_studs)
-    stud_common = stud_before.intersection(stud_after)
-
-    return stud_common
-
-
 def determine_distinct_students(df_before: pd.DataFrame,
                                 df_after: pd.DataFrame,
                                 id_column: str) -> tuple[list[str]]:
@@ -68,92 +64,65 @@ def determine_distinct_students(df_before: pd.DataFrame,
 def paired_ttest(df_before: pd.DataFrame, df_after: pd.DataFrame, id_column: str) -> \
         tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame,
               pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    # first make sure the dataframe are ordered by the same column (student_anon)
-    df_before = df_before.sort_values(by=[id_column])
-    df_after = df_after.sort_values(by=[id_column])
+    # scipy.stats is slow to import and only needed for the T-test
+    from scipy import stats
 
     questions, questions_post = determine_common_questions(
         df_before.columns, df_after.columns)
-    stud_common = determine_common_students(
-        df_before[id_column].values, df_after[id_column].values)
 
-    # Extract data from post survey for questions only available in post survey
-    df_post = df_after[[id_column, *questions_post]]
-    # Extract data from both dataframes for common questions only
-    df_before = df_before[[id_column, *questions]]
-    df_after = df_after[[id_column, *questions]]
+    # create shorthands for the questions
+    quests_before = [f'before_{n:02}' for n in range(1, len(questions)+1)]
+    quests_after = [f'after_{n:02}' for n in range(1, len(questions)+1)]
 
-    # Extract data only for common students
-    df_bf = df_before[df_before[id_column].isin(stud_common)]
-    df_af = df_after[df_after[id_column].isin(stud_common)]
-    df_post_common_stud = df_post[df_post[id_column].isin(stud_common)]
+    # combine into single dataset with only the overlapping students: the
+    # inner merge keeps the common students, ordered by the id_column
+    # (student_anon). Also keep the questions only available in post survey
+    df_bf = df_before[[id_column, *questions]].set_axis(
+        [id_column, *quests_before], axis=1)
+    df_af = df_after[[id_column, *questions, *questions_post]].set_axis(
+        [id_column, *quests_after, *questions_post], axis=1)
+    df_merged = df_bf.merge(df_af, on=id_column, sort=True)
 
     # The id_column content can now be transformed into something more readable
-    # by adding an additional column with a non-descript student number to both surveys
-    # and removing the anonymized id_column
-    stud_count = len(stud_common)
-    stud_names = [f'student_{n:02}' for n in range(1, stud_count + 1)]
-    df_bf = df_bf.assign(student=stud_names)
-    df_af = df_af.assign(student=stud_names)
-    df_bf = df_bf.drop(columns=[id_column])
-    df_af = df_af.drop(columns=[id_column])
-    df_post_common_stud = df_post_common_stud.assign(student=stud_names)
-    df_post_common_stud = df_post_common_stud.drop(columns=[id_column])
+    # by replacing the anonymized id_column with a non-descript student number
+    stud_names = [f'student_{n:02}' for n in range(1, len(df_merged) + 1)]
+    df_merged[id_column] = stud_names
     # for the remainder: the id_column has now changed!
+    df_merged = df_merged.rename(columns={id_column: 'student'})
     id_column = 'student'
-    # reorder columns
-    new_order = [id_column, *df_bf.columns[:-1]]
-    df_bf = df_bf[new_order]
-    df_af = df_af[new_order]
-    df_post_common_stud = df_post_common_stud[[id_column, *questions_post]]
-
-    # create shorthands for the questions
-    quests_before = [f'before_{n:02}' for n in range(1, len(questions)+1)]
-    quests_after = [f'after_{n:02}' for n in range(1, len(questions)+1)]
 
-    # combine into single dataset with only
-    # overlapping students and questions from Pre and Post survey results
-    df_bf.columns = [id_column, *quests_before]
-    df_af.columns = [id_column, *quests_after]
-    df_combined = df_bf.merge(df_af, on=id_column)
+    df_bf = df_merged[[id_column, *quests_before]]
+    df_af = df_merged[[id_column, *quests_after]]
+    df_post_common_stud = df_merged[[id_column, *questions_post]]
     combined_cols = [id_column, *
                      [q for tup in zip(quests_before, quests_after) for q in tup]]
-    df_combined = df_combined[combined_cols]
+    df_combined = df_merged[combined_cols]
 
-    # calculate descriptive stats (mean, stdev, median) for each question
+    # calculate descriptive stats (mean, stdev) for each question
     # in both pre- and post-surveys
     tr_bf = df_bf[quests_before]
-    stat_bf = tr_bf.describe()
     tr_af = df_af[quests_after]
-    stat_af = tr_af.describe()
-    mean_bf = stat_bf.loc['mean'].values
-    std_bf = stat_bf.loc['std'].values
-    mean_af = stat_af.loc['mean'].values
-    std_af = stat_af.loc['std'].values
-
-    # Apply T-test for each question
-    pairs = []
-    for bef, aft, question, m_bf, s_bf, m_af, s_af in zip(quests_before, quests_after, questions,
-                                                          mean_bf, std_bf,
-                                                          mean_af, std_af):
-        df_q = df_combined[[id_column, bef, aft]]
-        res = stats.ttest_rel(df_q[bef].values, df_q[aft].values)
-        pairs.append({'question': question, 'statistic': res.statistic, 'pvalue': res.pvalue,
-                      'mean_pre': m_bf, 'std_pre': s_bf,
-                      'mean_post': m_af, 'std_post': s_af})
-
-    # apply Ttest for each student
-    stud_pairs = []
-    for stud in stud_names:
-        before = df_bf[df_bf[id_column] == stud][quests_before[1:]].values[0]
-        after = df_af[df_af[id_column] == stud][quests_after[1:]].values[0]
-        res = stats.ttest_rel(before, after)
-        stud_pairs.append(
-            {id_column: stud, 'statistic': res.statistic, 'pvalue': res.pvalue})
+    mean_bf = tr_bf.mean().values
+    std_bf = tr_bf.std().values
+    mean_af = tr_af.mean().values
+    std_af = tr_af.std().values
+
+    # Apply T-test for each question, all questions at once
+    before = tr_bf.to_numpy(dtype=np.float64)
+    after = tr_af.to_numpy(dtype=np.float64)
+    res = stats.ttest_rel(before, after, axis=0)
+    df_pairs = pd.DataFrame({'question': questions,
+                             'statistic': res.statistic, 'pvalue': res.pvalue,
+                             'mean_pre': mean_bf, 'std_pre': std_bf,
+                             'mean_post': mean_af, 'std_post': std_af})
+
+    # apply Ttest for each student, all students at once: the rows of df_bf and
+    # df_af are in the same student order
+    res = stats.ttest_rel(before[:, 1:], after[:, 1:], axis=1)
+    df_stud_pairs = pd.DataFrame(
+        {id_column: stud_names, 'statistic': res.statistic, 'pvalue': res.pvalue})
 
     # turn results into dataframes
-    df_pairs = pd.DataFrame(pairs)
-    df_stud_pairs = pd.DataFrame(stud_pairs)
     question_legend = [questions, quests_before, quests_after]
     df_legend = pd.DataFrame(question_legend).T
     df_legend.columns = ['Question', 'Before_question_ID', 'After_question_ID']
@@ -9,5 +9,5 @@ CLEAN_SHEET_POST_SURVEY = 'Clean post-survey'
 # Note that this column will NOT end up in the cleaned and final outputs
 DEFAULT_STUDENT_COLUMN = 'Your student number'
 # columns to drop in cleaned output
-DROP_COLUMNS = ['ID', 'Start time', 'Completion time',
-                'Email', 'Name', 'Last modified time']
+DROP_COLUMNS = frozenset({'ID', 'Start time', 'Completion time',
+                          'Email', 'Name', 'Last modified time'})
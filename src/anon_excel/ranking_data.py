@@ -7,14 +7,13 @@ EXPECTED_COLUMNS = ['question', 'Strongly agree (SA)', 'Agree (A)', 'Neutral (N)
 
 
 def read_ranking_data(fn: Path, worksheet: str = 'Scoring') -> pd.DataFrame:
-    df = pd.read_excel(fn, sheet_name=worksheet)
+    df = pd.read_excel(fn, sheet_name=worksheet, engine='calamine')
     df = df[EXPECTED_COLUMNS]
     df = df.set_index('question')
-    dct = df.to_dict('records')
+    # a question listed more than once: the last row wins
+    df = df[~df.index.duplicated(keep='last')]
 
-    ranking = {q: rec for q, rec in zip(df.index, dct)}
-
-    return ranking
+    return df.to_dict(orient='index')
 
 
 rank_lookup = None
@@ -30,3 +29,9 @@ def load_ranking_from_folder(folder: Path) -> bool:
 
 def get_rank_lookup() -> pd.DataFrame:
     return rank_lookup
+
+
+def set_rank_lookup(lookup: dict) -> None:
+    '''Use an already loaded ranking lookup, fe. in a worker process'''
+    global rank_lookup
+    rank_lookup = lookup
@@ -1,11 +1,14 @@
+from collections.abc import Callable
 from hashlib import blake2b
+import os
 from pathlib import Path
-import string
 
+import numpy as np
 import pandas as pd
 
-from anon_excel.constants import ANONYMOUS_ID
+from anon_excel.constants import ANONYMOUS_ID, DROP_COLUMNS
 from anon_excel.calc_stats import category_to_rank
+from anon_excel.ranking_data import get_rank_lookup
 
 
 def find_survey_files(folder: Path, allow_missing_post: bool = False) -> list[tuple[Path, Path]]:
@@ -20,85 +23,137 @@ def find_survey_files(folder: Path, allow_missing_post: bool = False) -> list[tu
     '''
     stem_pre = 'Pre'
     stem_post = 'Post'
-    files = list(folder.glob(f'{stem_pre}*.xlsx'))
-    if len(files) == 0:
-        print('No survey excel files found')
-        return []
+    # read the folder only once; normcase makes the name matching
+    # case-insensitive where the file system is (Windows)
+    try:
+        with os.scandir(folder) as entries:
+            excel_files = {os.path.normcase(e.name): e.name for e in entries
+                           if e.is_file()}
+    except FileNotFoundError:
+        excel_files = {}
+    prefix = os.path.normcase(stem_pre)
+    files = sorted(name for key, name in excel_files.items()
+                   if key.startswith(prefix) and key.endswith('.xlsx'))
 
-    files = [Path(f) for f in files]
     surveys = []
     for pre in files:
-        post_file = pre.with_stem(stem_post + pre.stem[len(stem_pre):])
-        if post_file.exists():
-            surveys.append((pre, post_file))
+        post_name = excel_files.get(os.path.normcase(stem_post + pre[len(stem_pre):]))
+        if post_name:
+            surveys.append((folder / pre, folder / post_name))
         elif allow_missing_post:
-            surveys.append((pre, Path('')))
+            surveys.append((folder / pre, Path('')))
 
     return surveys
 
 
-def read_and_clean_survey(excel_name: Path, column: str) -> pd.DataFrame:
+def read_and_clean_survey(excel_name: Path, column: str,
+                          usecols: Callable[[str], bool] | None = None) -> pd.DataFrame:
     '''Read the excel data, remove all records that have invalid
        data in the `column` field (usually the user ID), and change
-       the type from Object to string'''
-    df = pd.read_excel(excel_name)
-    df = df.dropna(axis='index', subset=[column])
-    df = df.astype({column: 'string'})
-    names = df[column]
-    df[column] = names.apply(lambda x: x.strip())
-    # throw away duplicate student records (keep first)
-    df = df.drop_duplicates(subset=[column])
+       the type from Object to string.
+       Optionally `usecols` selects the columns to read by name'''
+    df = pd.read_excel(excel_name, engine='calamine', usecols=usecols)
+    names = df[column].astype('string').str.strip()
+    # select in one pass: records with an ID, and of duplicate
+    # student records only the first
+    keep = names.notna() & ~names.duplicated()
+    df = df[keep].assign(**{column: names[keep]})
 
     return df
 
 
+def cleaned_columns() -> Callable[[str], bool]:
+    '''Select the columns for the cleaned output: all columns, except the
+       ones that are always dropped from the output (DROP_COLUMNS)
+    '''
+    return lambda col: col not in DROP_COLUMNS
+
+
+def analysis_columns(namecol: str) -> Callable[[str], bool]:
+    '''Select only the columns needed for the T-test: the personal ID
+       column (`namecol`) and the survey questions in the ranking table.
+       Other columns, fe. free-text answers, are skipped while reading.
+    '''
+    rank_lookup = get_rank_lookup()
+    return lambda col: col == namecol or col in rank_lookup
+
+
 def strip_leading_letter(name: str) -> str:
-    if not name.startswith(tuple(string.digits)):
+    # single comparison on the first character (ASCII digits only)
+    if not '0' <= name[:1] <= '9':
         return name[1:]
 
     return name
 
 
 def strip_leading_letter_from_column(df: pd.DataFrame, namecol: str) -> pd.DataFrame:
-    series = df[namecol]
-    df[namecol] = series.apply(strip_leading_letter)
+    # vectorized version of strip_leading_letter
+    series = df[namecol].astype('string')
+    starts_with_digit = series.str.match('[0-9]').fillna(True)
+    df[namecol] = series.where(starts_with_digit, series.str[1:])
 
     return df
 
 
+# anonymized ID's of all surveys processed so far, shared by all surveys
+# that do not pass their own cache to transform_to_anonymous
+_id_cache: dict[str, str] = {}
+
+
+def hash_ids(ids: list[str], digest_size: int = 8) -> list[str]:
+    '''Hash a batch of IDs with the blake2b stable hash function.
+       Leading and trailing whitespace is ignored.
+    '''
+    return [blake2b(s.strip().encode('utf-8'), digest_size=digest_size).hexdigest()
+            for s in ids]
+
+
 def transform_to_anonymous(df: pd.DataFrame,
-                           on_column: str, to_column: str) -> pd.DataFrame:
+                           on_column: str, to_column: str,
+                           id_cache: dict[str, str] | None = None) -> pd.DataFrame:
     '''find student number column and anonymize, using
        the blake2b stable hash function. This will add a new column.
+       The optional `id_cache` holds already anonymized ID's; it is
+       updated with the new ones. By default the module cache is used, so
+       each student is only hashed once for all surveys.
        return unchanged if column is not in dataframe
     '''
     if on_column not in df.columns:
         return df
 
-    series = df[on_column]
-    df[to_column] = series.apply(lambda s: blake2b(
-        bytes(s.strip(), 'utf-8'), digest_size=8).hexdigest()).astype('string')
-    cur_cols = list(df.columns)
-    ix = cur_cols.index(on_column)
-    new_cols = cur_cols[0:ix] + cur_cols[-1:] + cur_cols[ix:-1]
-    df = df[new_cols]
+    if id_cache is None:
+        id_cache = _id_cache
+    # hash every distinct ID only once, duplicates are looked up
+    codes, uniq = pd.factorize(df[on_column], use_na_sentinel=False)
+    missing = [s for s in uniq if s not in id_cache]
+    id_cache.update(zip(missing, hash_ids(missing)))
+    digests = np.array([id_cache[s] for s in uniq], dtype=object)
+    if to_column in df.columns:
+        # fe. a cleaned survey that is processed again: replace the column
+        df = df.drop(columns=[to_column])
+    # add the anonymized column just before the on_column
+    df.insert(df.columns.get_loc(on_column), to_column,
+              pd.array(digests[codes], dtype='string'))
 
     return df
 
 
-def load_and_prepare_survey_data(survey_file: str, namecol: str,
-                                 strip: bool) -> pd.DataFrame:
+def load_and_prepare_survey_data(survey_file: str, namecol: str, strip: bool,
+                                 usecols: Callable[[str], bool] | None = None,
+                                 anonymize: bool = True) -> pd.DataFrame:
     '''Read survey file, remove invalid data, remove leading letter if any from
        personal ID, transcode this personal ID's (in the `namecol` field) into
        anonymized values, and translate the answer code into numerical
-       rankings, according to the `scoring.xlsx` data
+       rankings, according to the `scoring.xlsx` data.
+       Use `usecols` to read only a selection of the columns.
+       With `anonymize` False no anonymized column is added.
     '''
-    df = read_and_clean_survey(Path(survey_file), namecol)
+    df = read_and_clean_survey(Path(survey_file), namecol, usecols)
     if strip:
         df = strip_leading_letter_from_column(df, namecol)
 
-    df[namecol]
-    df = transform_to_anonymous(df, on_column=namecol, to_column=ANONYMOUS_ID)
+    if anonymize:
+        df = transform_to_anonymous(df, on_column=namecol, to_column=ANONYMOUS_ID)
     df_ranked = category_to_rank(df)
 
     return df_ranked
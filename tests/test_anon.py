@@ -1,6 +1,15 @@
+import logging
+import os
+from pathlib import Path
 from unittest.mock import Mock
+import numpy as np
+import pandas as pd
 import pytest
-from anon_excel.anon import determine_survey_data_name
+import anon_excel.constants as const
+from anon_excel.anon import (
+    COLOR_COMMON, COLOR_PRE_ONLY, determine_survey_data_name, get_parser,
+    process_surveys, student_colors, write_to_excel)
+from anon_excel.ranking_data import get_rank_lookup, load_ranking_from_folder
 
 
 @pytest.mark.parametrize("filename, sequence_nr, expected", [
@@ -8,7 +17,8 @@ from anon_excel.anon import determine_survey_data_name
     ("data_survey.xlsx", 2, "data_survey_02"),
     ("prefix_(1-89)_suffix.xlsx", 4, "data_survey_(1-89)"),
     ("(1-89)_data_survey.xlsx", 5, "data_survey_(1-89)"),
-    ("data_survey_(1-89).xlsx", 6, "data_survey_(1-89)")
+    ("data_survey_(1-89).xlsx", 6, "data_survey_(1-89)"),
+    ("survey_(1-89)_(2-34).xlsx", 7, "data_survey_(2-34)")
 ])
 def test_determine_survey_data_name(filename, sequence_nr, expected):
     survey_file = Mock()
@@ -20,3 +30,65 @@ def test_determine_survey_data_name_with_non_path_input():
     with pytest.raises(AttributeError):
         # Passing an integer instead of a Path object
         determine_survey_data_name(123, 1)
+
+
+def test_write_to_excel_roundtrip(tmp_path):
+    '''all rows of all sheets are written, missing values as empty cells'''
+    df1 = pd.DataFrame({'student': ['student_01', 'student_02', 'student_03'],
+                        'statistic': [1.5, np.nan, np.inf],
+                        'count': [1, 2, 3]})
+    df2 = pd.DataFrame({'question': ['q1', None], 'pvalue': [0.25, 0.5]})
+    excel_file = tmp_path / 'out.xlsx'
+
+    write_to_excel(excel_file, sheets=[(df1, 'first'), (df2, 'second')])
+
+    sheets = pd.read_excel(excel_file, sheet_name=None, engine='calamine')
+    assert list(sheets) == ['first', 'second']
+    assert list(sheets['first']['student']) == list(df1['student'])
+    assert list(sheets['first']['count']) == [1, 2, 3]
+    assert sheets['first']['statistic'][0] == 1.5
+    assert np.isnan(sheets['first']['statistic'][1])
+    assert np.isinf(sheets['first']['statistic'][2])
+    assert pd.isna(sheets['second']['question'][1])
+    assert list(sheets['second']['pvalue']) == [0.25, 0.5]
+
+
+def test_student_colors():
+    students = pd.Series(['s1', 's2', 's3'])
+    colors = student_colors(students, stud_common={'s1', 's3'}, studs_only={'s2'},
+                            only_color=COLOR_PRE_ONLY)
+    assert colors == [COLOR_COMMON, COLOR_PRE_ONLY, COLOR_COMMON]
+
+
+def test_process_surveys_multiple_workers(tmp_path, monkeypatch, caplog):
+    '''with more than one survey set, the sets are processed in worker
+       processes: each set has its output, and the worker logging
+       reaches the main process
+    '''
+    load_ranking_from_folder(Path('tests/test_data'))
+    questions = list(get_rank_lookup())[:3]
+    answers = ['Strongly agree (SA)', 'Agree (A)', 'Neutral (N)', 'Disagree (D)']
+    surveys = []
+    for seq in ['(1-10)', '(1-20)']:
+        pair = (tmp_path / f'Pre_survey_{seq}.xlsx',
+                tmp_path / f'Post_survey_{seq}.xlsx')
+        for shift, survey in enumerate(pair):
+            data = {const.DEFAULT_STUDENT_COLUMN: ['s123', 's456', 's789', 's012']}
+            for nr, question in enumerate(questions):
+                data[question] = answers[nr + shift:] + answers[:nr + shift]
+            pd.DataFrame(data).to_excel(survey, index=False, engine='xlsxwriter')
+        surveys.append(pair)
+    args = get_parser().parse_args([str(tmp_path), '-x', '-t'])
+    monkeypatch.setattr(os, 'cpu_count', lambda: 2)
+    caplog.set_level(logging.INFO)
+
+    process_surveys(tmp_path, surveys, const.DEFAULT_STUDENT_COLUMN, args)
+
+    for seq in ['(1-10)', '(1-20)']:
+        name = f'{const.DATA_OUTPUT_BASENAME}_{seq}.xlsx'
+        assert (tmp_path / const.CLEANED_OUTPUT_BASE
+                / f'{const.CLEANED_OUTPUT_BASE}_{name}').is_file()
+        assert (tmp_path / const.ANALYSIS_OUTPUT_BASE
+                / f'{const.ANALYSIS_OUTPUT_BASE}_{name}').is_file()
+    worker_records = [r for r in caplog.records if r.process != os.getpid()]
+    assert any(r.getMessage() == 'Initiating analysis' for r in worker_records)
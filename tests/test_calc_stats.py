@@ -1,7 +1,8 @@
 import numpy as np
 import pandas as pd
 from pathlib import Path
-from anon_excel.calc_stats import category_to_rank
+from scipy import stats
+from anon_excel.calc_stats import category_to_rank, paired_ttest
 from anon_excel.ranking_data import load_ranking_from_folder, get_rank_lookup
 
 RANK_TEST_DATA = [{'Your student number': 's123495',
@@ -49,3 +50,68 @@ def test_category_to_rank_positiv():
 
     assert np.array_equal(q1, arr1)
     assert np.array_equal(q2, arr2)
+
+
+def test_category_to_rank_normalize_whitespace():
+    answers = ['Strongly  agree (SA)', 'Agree\n(A)', None, 'unknown']
+    df = pd.DataFrame({'I trust others in this course': answers})
+
+    new_df = category_to_rank(df)
+
+    q1 = new_df['I trust others in this course'].values
+    assert np.array_equal(q1, np.array([4, 3, np.nan, np.nan]), equal_nan=True)
+
+
+def test_paired_ttest_common_students():
+    '''only students in both surveys are compared, and the pre and post answers
+       of each student stay together, whatever the order of the records
+    '''
+    q1, q2, q3 = list(get_rank_lookup())[:3]
+    df_before = pd.DataFrame({'anon': ['c', 'a', 'x', 'b'],
+                              q1: [2, 0, 4, 1], q2: [2, 1, 4, 0], q3: [0, 1, 4, 2]})
+    df_after = pd.DataFrame({'anon': ['b', 'y', 'c', 'a'],
+                             q1: [2, 0, 4, 1], q2: [1, 0, 4, 2], q3: [4, 0, 3, 1]})
+
+    df_pairs, df_combined, _, df_bf, df_af, df_stud_pairs = paired_ttest(
+        df_before, df_after, id_column='anon')
+
+    # students a, b and c, in the order of their (anonymized) ID
+    assert list(df_bf['student']) == ['student_01', 'student_02', 'student_03']
+    assert df_bf[[q1, q2, q3]].values.tolist() == [[0, 1, 1], [1, 0, 2], [2, 2, 0]]
+    assert df_af[[q1, q2, q3]].values.tolist() == [[1, 2, 1], [2, 1, 4], [4, 4, 3]]
+    assert list(df_combined.columns) == ['student', 'before_01', 'after_01',
+                                         'before_02', 'after_02',
+                                         'before_03', 'after_03']
+    assert df_combined.iloc[:, 1:].values.tolist() == [[0, 1, 1, 2, 1, 1],
+                                                       [1, 2, 0, 1, 2, 4],
+                                                       [2, 4, 2, 4, 0, 3]]
+    assert len(df_pairs) == 3
+    assert len(df_stud_pairs) == 3
+
+
+def test_paired_ttest_values():
+    '''the batched T-tests give the same results as one T-test per question
+       and one T-test per student (skipping the first question)
+    '''
+    questions = list(get_rank_lookup())[:4]
+    before = np.array([[0, 1, 2, 4], [1, 3, 0, 2], [4, 2, 2, 1],
+                       [2, 0, 1, 3], [3, 4, 0, 0], [1, 1, 3, 2]])
+    after = np.array([[1, 3, 2, 4], [2, 4, 1, 1], [4, 4, 3, 3],
+                      [2, 1, 3, 4], [4, 4, 2, 1], [0, 2, 4, 4]])
+    ids = ['a', 'b', 'c', 'd', 'e', 'f']
+    df_before = pd.DataFrame(before, columns=questions).assign(anon=ids)
+    df_after = pd.DataFrame(after, columns=questions).assign(anon=ids)
+
+    df_pairs, _, _, _, _, df_stud_pairs = paired_ttest(
+        df_before, df_after, id_column='anon')
+
+    df_pairs = df_pairs.set_index('question')
+    for col, question in enumerate(questions):
+        res = stats.ttest_rel(before[:, col], after[:, col])
+        assert np.isclose(df_pairs.loc[question, 'statistic'], res.statistic)
+        assert np.isclose(df_pairs.loc[question, 'pvalue'], res.pvalue)
+    assert len(df_stud_pairs) == len(ids)
+    for row, (_, stud) in enumerate(df_stud_pairs.iterrows()):
+        res = stats.ttest_rel(before[row, 1:], after[row, 1:])
+        assert np.isclose(stud['statistic'], res.statistic)
+        assert np.isclose(stud['pvalue'], res.pvalue)
@@ -0,0 +1,19 @@
+import pandas as pd
+
+from anon_excel.ranking_data import EXPECTED_COLUMNS, read_ranking_data
+
+
+def test_read_ranking_data_duplicate_question(tmp_path):
+    '''a question listed twice is not an error: the last row wins'''
+    scoring = tmp_path / 'Scoring.xlsx'
+    pd.DataFrame([['q1', 4, 3, 2, 1, 0],
+                  ['q2', 0, 1, 2, 3, 4],
+                  ['q1', 0, 1, 2, 3, 4]], columns=EXPECTED_COLUMNS
+                 ).to_excel(scoring, sheet_name='Scoring', index=False,
+                            engine='xlsxwriter')
+
+    ranking = read_ranking_data(scoring)
+
+    assert sorted(ranking) == ['q1', 'q2']
+    assert ranking['q1']['Strongly agree (SA)'] == 0
+    assert ranking['q2']['Strongly agree (SA)'] == 0
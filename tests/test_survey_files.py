@@ -1,70 +1,90 @@
+import ntpath
 from pathlib import Path
-import mock
+from unittest import mock
+import pandas as pd
 
-from anon_excel.anon import remove_previous_results
-from anon_excel.survey_files import find_survey_files, strip_leading_letter
+from anon_excel.anon import find_previous_results, remove_previous_results
+from anon_excel.ranking_data import load_ranking_from_folder
+from anon_excel.survey_files import (
+    analysis_columns, cleaned_columns, find_survey_files, read_and_clean_survey,
+    strip_leading_letter, strip_leading_letter_from_column)
 
 
-@mock.patch('anon_excel.anon.Path.glob')
-def test_find_survey_files_none(mock_glob):
+def make_files(folder: Path, names: list[str]) -> None:
+    for name in names:
+        (folder / name).touch()
+
+
+def test_find_survey_files_none(tmp_path):
     '''Check when no survey files are found'''
-    mock_glob.return_value = []
-    folder = Path('data')
-    files = find_survey_files(folder)
+    make_files(tmp_path, ['Scoring.xlsx', 'Post_survey1.xlsx'])
+    files = find_survey_files(tmp_path)
     assert len(files) == 0
 
 
-@mock.patch('anon_excel.anon.Path.glob')
-@mock.patch('anon_excel.anon.Path.exists')
-def test_find_survey_files_one_of_two(mock_exists, mock_glob):
+def test_find_survey_files_one_of_two(tmp_path):
     '''Check for return of tuples with existing pre and post surveys'''
-    mock_glob.return_value = ['Pre_survey1.xlsx', 'Pre_survey2.xlsx']
-    mock_exists.side_effect = [False, True]
-    folder = Path('data')
-    files = find_survey_files(folder)
+    make_files(tmp_path, ['Pre_survey1.xlsx', 'Pre_survey2.xlsx', 'Post_survey2.xlsx'])
+    files = find_survey_files(tmp_path)
     assert len(files) == 1
-    assert files[0][1] == Path('Post_survey2.xlsx')
+    assert files[0][1] == tmp_path / 'Post_survey2.xlsx'
 
 
-@mock.patch('anon_excel.anon.Path.glob')
-@mock.patch('anon_excel.anon.Path.exists')
-def test_find_survey_files_two_of_two_missing_post(mock_exists, mock_glob):
+def test_find_survey_files_two_of_two_missing_post(tmp_path):
     '''Check for return of tuples with existing pre and optional post'''
-    mock_glob.return_value = ['Pre_survey1.xlsx', 'Pre_survey2.xlsx']
-    mock_exists.side_effect = [False, True]
-    folder = Path('data')
-    files = find_survey_files(folder, allow_missing_post=True)
+    make_files(tmp_path, ['Pre_survey1.xlsx', 'Pre_survey2.xlsx', 'Post_survey2.xlsx'])
+    files = find_survey_files(tmp_path, allow_missing_post=True)
     assert len(files) == 2
     assert len(files[0][1].name) == 0
-    assert files[1][1] == Path('Post_survey2.xlsx')
+    assert files[1][1] == tmp_path / 'Post_survey2.xlsx'
 
 
-@mock.patch('anon_excel.anon.Path.glob')
-@mock.patch('anon_excel.anon.Path.exists')
-def test_find_survey_files_two_of_two(mock_exists, mock_glob):
-    mock_glob.return_value = ['Pre_survey1.xlsx', 'Pre_survey2.xlsx']
-    mock_exists.side_effect = [True, True]
-    folder = Path('data')
-    files = find_survey_files(folder)
+def test_find_survey_files_two_of_two(tmp_path):
+    make_files(tmp_path, ['Pre_survey1.xlsx', 'Pre_survey2.xlsx',
+                          'Post_survey1.xlsx', 'Post_survey2.xlsx'])
+    files = find_survey_files(tmp_path)
     assert len(files) == 2
-    assert files[0][1] == Path('Post_survey1.xlsx')
-    assert files[1][1] == Path('Post_survey2.xlsx')
+    assert files[0][1] == tmp_path / 'Post_survey1.xlsx'
+    assert files[1][1] == tmp_path / 'Post_survey2.xlsx'
+
+
+def test_find_previous_results(tmp_path):
+    make_files(tmp_path, ['analysis_course2.xlsx', 'analysis_course1.xlsx',
+                          'analysis_notes.txt', 'cleaned_course1.xlsx'])
+    files = find_previous_results(tmp_path, 'analysis')
+    assert files == [tmp_path / 'analysis_course1.xlsx',
+                     tmp_path / 'analysis_course2.xlsx']
+
 
+@mock.patch('anon_excel.anon.os.path.normcase', ntpath.normcase)
+def test_find_previous_results_case_insensitive(tmp_path):
+    '''where the file system is case-insensitive, the case of the
+       output names does not matter'''
+    make_files(tmp_path, ['Analysis_course1.XLSX', 'analysis_course2.xlsx',
+                          'cleaned_course1.xlsx'])
+    files = find_previous_results(tmp_path, 'analysis')
+    assert files == [tmp_path / 'Analysis_course1.XLSX',
+                     tmp_path / 'analysis_course2.xlsx']
 
-@mock.patch('anon_excel.anon.os.remove')
-def test_remove_previous_results_called(mock_remove):
+
+def test_find_previous_results_missing_folder(tmp_path):
+    assert find_previous_results(tmp_path / 'analysis', 'analysis') == []
+
+
+@mock.patch('anon_excel.anon.os.unlink')
+def test_remove_previous_results_called(mock_unlink):
     files = [Path(p) for p in ['analysis_course1.xlsx', 'analysis_course2.xlsx']]
     remove_previous_results(files, which_output='analysis', do_overwrite=True)
-    assert mock_remove.call_count == 2
-    assert mock_remove.call_args_list == [mock.call(f) for f in files]
+    assert mock_unlink.call_count == 2
+    assert mock_unlink.call_args_list == [mock.call(f) for f in files]
 
 
-@mock.patch('anon_excel.anon.os.remove')
-def test_remove_previous_results_called_for_non_matching_files(mock_remove):
+@mock.patch('anon_excel.anon.os.unlink')
+def test_remove_previous_results_called_for_non_matching_files(mock_unlink):
     files = [Path(p) for p in ['analysis_course1.xlsx', 'analysis_course2.xlsx']]
     remove_previous_results(files, do_overwrite=True, which_output='cleaned')
-    assert mock_remove.call_count == 2
-    assert mock_remove.call_args_list == [mock.call(f) for f in files]
+    assert mock_unlink.call_count == 2
+    assert mock_unlink.call_args_list == [mock.call(f) for f in files]
 
 
 def test_strip_leading_letter():
@@ -74,3 +94,43 @@ def test_strip_leading_letter():
     assert strip_leading_letter('012') == '012'
     assert strip_leading_letter('!345') == '345'
     assert strip_leading_letter('345abc') == '345abc'
+
+
+def test_read_and_clean_survey_analysis_columns(tmp_path):
+    '''Check that only the ID and question columns are read, and that
+       records without ID and duplicate records are removed'''
+    load_ranking_from_folder(Path('tests/test_data'))
+    survey = tmp_path / 'Pre_survey.xlsx'
+    pd.DataFrame({'Your student number': [' s123 ', None, 's456', 's123'],
+                  'I trust others in this course': ['Agree (A)'] * 4,
+                  'Any remarks?': ['none', 'a lot', None, 'none']}
+                 ).to_excel(survey, index=False)
+
+    df = read_and_clean_survey(survey, 'Your student number',
+                               analysis_columns('Your student number'))
+
+    assert list(df.columns) == ['Your student number', 'I trust others in this course']
+    assert list(df['Your student number']) == ['s123', 's456']
+
+
+def test_read_and_clean_survey_cleaned_columns(tmp_path):
+    '''Check that the columns that are always dropped are not read'''
+    survey = tmp_path / 'Pre_survey.xlsx'
+    pd.DataFrame({'ID': [1, 2],
+                  'Email': ['anonymous', 'anonymous'],
+                  'Your student number': ['s123', 's456'],
+                  'Any remarks?': ['none', 'a lot']}
+                 ).to_excel(survey, index=False)
+
+    df = read_and_clean_survey(survey, 'Your student number', cleaned_columns())
+
+    assert list(df.columns) == ['Your student number', 'Any remarks?']
+
+
+def test_strip_leading_letter_from_column():
+    names = ['A123', 'B456789', '', '012', '!345', '345abc']
+    df = pd.DataFrame({'id': pd.array(names, dtype='string')})
+
+    df = strip_leading_letter_from_column(df, 'id')
+
+    assert list(df['id']) == [strip_leading_letter(name) for name in names]
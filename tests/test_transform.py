@@ -16,7 +16,8 @@ def test_transform_to_anonymous_no_id_col():
 
     df_new = transform_to_anonymous(df, 'My student number', 'anon')
 
-    assert df_new.equals(df)
+    assert df_new is df
+    assert list(df_new.columns) == ['Your student number', 'q1', 'q2']
 
 
 def test_transform_to_anonymous_id_col_removed():
@@ -29,3 +30,47 @@ def test_transform_to_anonymous_id_col_removed():
     df_new = transform_to_anonymous(df, 'Your student number', 'anon')
     assert 'Your student number' in df_new.columns
     assert 'anon' in df_new.columns
+
+
+def test_transform_to_anonymous_stable_hash():
+    '''test that the anonymized ID is stable and identical for
+       duplicate student numbers
+    '''
+    df = pd.DataFrame([*ANONIMIZE_DATA, ANONIMIZE_DATA[0]])
+
+    df_new = transform_to_anonymous(df, 'Your student number', 'anon')
+
+    assert list(df_new['anon']) == ['253e4af2296fff2f', 'de0bcd451b15a138',
+                                    '253e4af2296fff2f']
+
+
+def test_transform_to_anonymous_uses_cache():
+    '''test that ID's already in the cache are not hashed again,
+       and new ID's are added to the cache
+    '''
+    df = pd.DataFrame(ANONIMIZE_DATA)
+    id_cache = {'s12345': 'cached'}
+
+    df_new = transform_to_anonymous(df, 'Your student number', 'anon', id_cache)
+
+    assert list(df_new['anon']) == ['cached', 'de0bcd451b15a138']
+    assert id_cache['s125676'] == 'de0bcd451b15a138'
+
+
+def test_transform_to_anonymous_column_order():
+    '''test that the anonymized column is placed before the on column'''
+    df = pd.DataFrame(ANONIMIZE_DATA)
+
+    df_new = transform_to_anonymous(df, 'Your student number', 'anon')
+
+    assert list(df_new.columns) == ['anon', 'Your student number', 'q1', 'q2']
+
+
+def test_transform_to_anonymous_replaces_existing_column():
+    '''test that an existing anonymized column is replaced, not duplicated'''
+    df = pd.DataFrame(ANONIMIZE_DATA).assign(anon=['old', 'old'])
+
+    df_new = transform_to_anonymous(df, 'Your student number', 'anon')
+
+    assert list(df_new.columns) == ['anon', 'Your student number', 'q1', 'q2']
+    assert list(df_new['anon']) == ['253e4af2296fff2f', 'de0bcd451b15a138']